@@ -1,11 +1,15 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+import asyncio
 import os
 import logging
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
 from typing import List, Optional, Literal
 import uuid
 from datetime import datetime, timezone
@@ -16,7 +20,7 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncMongoClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Twilio setup
@@ -31,7 +35,7 @@ if twilio_account_sid and twilio_auth_token:
     except Exception as e:
         logging.error(f"Failed to initialize Twilio client: {e}")
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Configure logging
@@ -67,6 +71,7 @@ class Sensor(BaseModel):
     name: str
     type: Literal["motion", "door", "window"]
     zone_id: str
+    zone_name: Optional[str] = None
     status: Literal["active", "inactive", "triggered", "offline"] = "inactive"
     battery_level: int = 100
     last_triggered: Optional[datetime] = None
@@ -124,18 +129,147 @@ class SettingsUpdate(BaseModel):
 class SensorTrigger(BaseModel):
     sensor_id: str
 
+# Zones and sensors are paged with skip/limit, which needs a stable, unique order
+CREATED_SORT = [("created_at", 1), ("id", 1)]
+
+# List serializers are built once here rather than per request
+ZONES_ADAPTER = TypeAdapter(List[Zone])
+SENSORS_ADAPTER = TypeAdapter(List[Sensor])
+EVENTS_ADAPTER = TypeAdapter(List[Event])
+
 # ============ HELPER FUNCTIONS ============
 
+def to_mongo(model: BaseModel) -> dict:
+    # The stored models are flat and hold BSON-native values, so a shallow copy of
+    # the field values is all Mongo needs; no need to go through model_dump().
+    return dict(model.__dict__)
+
+# Turn a comma-separated ?fields= value into a Mongo projection. The id and the
+# model's required fields are always included so the documents still validate.
+def build_projection(model, fields: Optional[str]) -> dict:
+    if not fields:
+        return {"_id": 0}
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - model.model_fields.keys()
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    projection = {"_id": 0}
+    for name, field in model.model_fields.items():
+        if name == "id" or field.is_required() or name in requested:
+            projection[name] = 1
+    return projection
+
+def list_response(adapter: TypeAdapter, model, docs: list) -> Response:
+    # The documents come from our own collections, so skip validation and let the
+    # cached adapter write JSON bytes directly. exclude_unset drops fields that a
+    # ?fields= projection left out.
+    items = [model.model_construct(**doc) for doc in docs]
+    return Response(content=adapter.dump_json(items, exclude_unset=True), media_type="application/json")
+
+# Strong references to fire-and-forget tasks so they aren't garbage collected mid-flight
+_background_tasks = set()
+
+def finish_background_task(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task failed: {task.exception()!r}")
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(finish_background_task)
+    return task
+
+# Events are buffered and written in batches by event_flusher, so a burst of
+# triggers costs one insert_many instead of one round trip per event.
+EVENT_FLUSH_INTERVAL = 0.05
+EVENT_RETRY_INTERVAL = 1.0
+_event_buffer = []
+_event_pending = asyncio.Event()
+_event_stopping = asyncio.Event()
+# Held for the whole swap + insert, so a reader calling flush_events() also waits
+# for a batch another caller already has in flight
+_event_flush_lock = asyncio.Lock()
+
+async def flush_events() -> bool:
+    # Returns False if some events could not be written; those stay buffered,
+    # ahead of anything logged since, for the next flush to retry
+    global _event_buffer
+    async with _event_flush_lock:
+        if not _event_buffer:
+            return True
+        batch, _event_buffer = _event_buffer, []
+        try:
+            await db.events.insert_many(batch, ordered=False)
+            return True
+        except BulkWriteError as e:
+            # insert_many set _id on every document, so anything that did land on
+            # an earlier attempt comes back as a duplicate key and can be dropped
+            failed = [batch[error['index']] for error in e.details.get('writeErrors', []) if error.get('code') != 11000]
+            _event_buffer = failed + _event_buffer
+            if failed:
+                logger.error(f"Failed to write {len(failed)} events, will retry: {e}")
+            return not failed
+        except Exception as e:
+            _event_buffer = batch + _event_buffer
+            logger.error(f"Failed to write {len(batch)} events, will retry: {e}")
+            return False
+
+async def event_flusher():
+    while not _event_stopping.is_set():
+        await _event_pending.wait()
+        # Give the rest of a burst a moment to land in the same batch
+        await asyncio.sleep(EVENT_FLUSH_INTERVAL)
+        _event_pending.clear()
+        if not await flush_events():
+            _event_pending.set()
+            await asyncio.sleep(EVENT_RETRY_INTERVAL)
+    
+    # Drain what is left before the client closes
+    if not await flush_events():
+        logger.error(f"Dropping {len(_event_buffer)} unwritten events on shutdown")
+
+async def stop_event_flusher(task: asyncio.Task):
+    _event_stopping.set()
+    _event_pending.set()
+    await task
+
 async def log_event(event_type: str, message: str, severity: str = "info", sensor_id: str = None, zone_id: str = None):
     event = Event(type=event_type, message=message, severity=severity, sensor_id=sensor_id, zone_id=zone_id)
-    doc = event.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
-    await db.events.insert_one(doc)
+    _event_buffer.append(to_mongo(event))
+    # Alerts are written straight away, along with anything queued ahead of them.
+    # If that write fails they stay buffered and the flusher retries them.
+    if severity == "danger" and await flush_events():
+        return event
+    _event_pending.set()
     return event
 
-async def send_sms_alert(message: str):
-    settings = await db.settings.find_one({"id": "settings"}, {"_id": 0})
-    if not settings or not settings.get('sms_enabled') or not settings.get('alert_phone_number'):
+async def send_sms_alert(message: str, phone_number: str):
+    try:
+        # The Twilio client is blocking; keep it off the event loop
+        await asyncio.to_thread(
+            twilio_client.messages.create,
+            body=message,
+            from_=twilio_phone_number,
+            to=phone_number
+        )
+        await log_event("sms_sent", f"SMS alert sent: {message}", "info")
+        logger.info(f"SMS sent to {phone_number}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send SMS: {e}")
+        return False
+
+# Twilio accepts roughly one message per second, so alerts are queued and sent
+# one at a time by sms_worker instead of from the request handler.
+SMS_SEND_INTERVAL = 1.0
+_sms_queue = asyncio.Queue(maxsize=100)
+
+async def queue_sms_alert(message: str):
+    # Settings are checked when the alert is raised, not when it is sent, so only
+    # real sends take a queue slot and the recipient is fixed at trigger time
+    settings = await get_current_settings()
+    if not settings.sms_enabled or not settings.alert_phone_number:
         logger.info("SMS alerts disabled or no phone number configured")
         return False
     
@@ -144,29 +278,73 @@ async def send_sms_alert(message: str):
         return False
     
     try:
-        twilio_client.messages.create(
-            body=message,
-            from_=twilio_phone_number,
-            to=settings['alert_phone_number']
-        )
-        await log_event("sms_sent", f"SMS alert sent: {message}", "info")
-        logger.info(f"SMS sent to {settings['alert_phone_number']}")
+        _sms_queue.put_nowait((message, settings.alert_phone_number))
         return True
-    except Exception as e:
-        logger.error(f"Failed to send SMS: {e}")
+    except asyncio.QueueFull:
+        logger.error(f"SMS queue full, dropping alert: {message}")
         return False
 
+async def sms_worker():
+    while True:
+        message, phone_number = await _sms_queue.get()
+        try:
+            await send_sms_alert(message, phone_number)
+        except Exception as e:
+            logger.error(f"SMS worker failed to send alert: {e}")
+        finally:
+            _sms_queue.task_done()
+        # Every queued alert is a Twilio call, so pace them to the rate limit
+        await asyncio.sleep(SMS_SEND_INTERVAL)
+
+# System state and settings change rarely, so keep them in process for a few seconds.
+# Writes through this process replace the cached value immediately and bump a
+# generation counter; a read that started before the write sees the counter moved
+# and does not put its older value back in the cache.
+STATE_CACHE_TTL = 5.0
+_state_cache = {
+    "state": None, "state_ts": 0.0, "state_gen": 0,
+    "settings": None, "settings_ts": 0.0, "settings_gen": 0,
+}
+
+def get_cached(key: str):
+    if _state_cache[key] is not None and time.monotonic() - _state_cache[f"{key}_ts"] < STATE_CACHE_TTL:
+        return _state_cache[key]
+    return None
+
+def store_read(key: str, value, generation: int):
+    if _state_cache[f"{key}_gen"] != generation:
+        return
+    _state_cache[key] = value
+    _state_cache[f"{key}_ts"] = time.monotonic()
+
+def store_write(key: str, value):
+    _state_cache[f"{key}_gen"] += 1
+    _state_cache[key] = value
+    _state_cache[f"{key}_ts"] = time.monotonic()
+
 async def get_system_state():
+    cached = get_cached("state")
+    if cached is not None:
+        return cached
+    
+    generation = _state_cache["state_gen"]
+    # Seeded at startup, so the document always exists
     state = await db.system_state.find_one({"id": "system_state"}, {"_id": 0})
-    if not state:
-        default_state = SystemState()
-        doc = default_state.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
-        await db.system_state.insert_one(doc)
-        return default_state
-    if isinstance(state['updated_at'], str):
-        state['updated_at'] = datetime.fromisoformat(state['updated_at'])
-    return SystemState(**state)
+    system_state = SystemState.model_construct(**state)
+    store_read("state", system_state, generation)
+    return system_state
+
+async def get_current_settings():
+    cached = get_cached("settings")
+    if cached is not None:
+        return cached
+    
+    generation = _state_cache["settings_gen"]
+    # Seeded at startup, so the document always exists
+    settings = await db.settings.find_one({"id": "settings"}, {"_id": 0})
+    current_settings = Settings.model_construct(**settings)
+    store_read("settings", current_settings, generation)
+    return current_settings
 
 # ============ ROUTES ============
 
@@ -175,25 +353,26 @@ async def root():
     return {"message": "Home Intruder Alarm System API"}
 
 # System State
-@api_router.get("/system/state", response_model=SystemState)
+@api_router.get("/system/state", response_model=None, responses={200: {"model": SystemState}})
 async def get_state():
-    return await get_system_state()
+    state = await get_system_state()
+    return Response(content=state.model_dump_json(), media_type="application/json")
 
 @api_router.put("/system/state", response_model=SystemState)
 async def update_state(update: SystemStateUpdate):
-    current_state = await get_system_state()
-    old_mode = current_state.mode
     new_mode = update.mode
     
+    # Write the new state and get the previous mode back in the same round trip
     updated_state = SystemState(mode=new_mode)
-    doc = updated_state.model_dump()
-    doc['updated_at'] = doc['updated_at'].isoformat()
-    
-    await db.system_state.update_one(
+    previous_state = await db.system_state.find_one_and_update(
         {"id": "system_state"},
-        {"$set": doc},
-        upsert=True
+        {"$set": to_mongo(updated_state)},
+        upsert=True,
+        projection={"_id": 0, "mode": 1},
+        return_document=ReturnDocument.BEFORE
     )
+    store_write("state", updated_state)
+    old_mode = previous_state['mode'] if previous_state else "disarmed"
     
     # Log the state change
     if old_mode != new_mode:
@@ -207,70 +386,68 @@ async def update_state(update: SystemStateUpdate):
     return updated_state
 
 # Zones
-@api_router.get("/zones", response_model=List[Zone])
-async def get_zones():
-    zones = await db.zones.find({}, {"_id": 0}).to_list(100)
-    for zone in zones:
-        if isinstance(zone.get('created_at'), str):
-            zone['created_at'] = datetime.fromisoformat(zone['created_at'])
-    return zones
+@api_router.get("/zones", response_model=None, responses={200: {"model": List[Zone]}})
+async def get_zones(limit: int = Query(100, ge=1, le=100), offset: int = Query(0, ge=0), fields: Optional[str] = None):
+    projection = build_projection(Zone, fields)
+    zones = await db.zones.find({}, projection).sort(CREATED_SORT).skip(offset).limit(limit).to_list(limit)
+    return list_response(ZONES_ADAPTER, Zone, zones)
 
 @api_router.post("/zones", response_model=Zone)
 async def create_zone(zone_data: ZoneCreate):
     zone = Zone(**zone_data.model_dump())
-    doc = zone.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.zones.insert_one(doc)
+    await db.zones.insert_one(to_mongo(zone))
     await log_event("zone_added", f"Zone '{zone.name}' added", "info", zone_id=zone.id)
     return zone
 
 @api_router.put("/zones/{zone_id}", response_model=Zone)
 async def update_zone(zone_id: str, update: ZoneUpdate):
-    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
+    update_data = update.model_dump(exclude_none=True)
     if not update_data:
         raise HTTPException(status_code=400, detail="No update data provided")
     
-    result = await db.zones.update_one({"id": zone_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    zone = await db.zones.find_one_and_update(
+        {"id": zone_id},
+        {"$set": update_data},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not zone:
         raise HTTPException(status_code=404, detail="Zone not found")
     
-    zone = await db.zones.find_one({"id": zone_id}, {"_id": 0})
-    if isinstance(zone.get('created_at'), str):
-        zone['created_at'] = datetime.fromisoformat(zone['created_at'])
-    return Zone(**zone)
+    # Keep the zone name denormalized on its sensors
+    if 'name' in update_data:
+        await db.sensors.update_many({"zone_id": zone_id}, {"$set": {"zone_name": update_data['name']}})
+    
+    return Zone.model_construct(**zone)
 
 @api_router.delete("/zones/{zone_id}")
 async def delete_zone(zone_id: str):
-    zone = await db.zones.find_one({"id": zone_id}, {"_id": 0})
-    if not zone:
+    if not await db.zones.find_one({"id": zone_id}, {"_id": 1}):
         raise HTTPException(status_code=404, detail="Zone not found")
     
-    # Delete all sensors in this zone
+    # Sensors go first: if this fails partway the zone is still there, so a retry
+    # of the same request finishes the job instead of leaving orphaned sensors
     await db.sensors.delete_many({"zone_id": zone_id})
-    await db.zones.delete_one({"id": zone_id})
+    zone = await db.zones.find_one_and_delete({"id": zone_id}, projection={"_id": 0, "name": 1})
+    if not zone:
+        # Deleted by a concurrent request between the check and here
+        raise HTTPException(status_code=404, detail="Zone not found")
+    
     await log_event("zone_removed", f"Zone '{zone['name']}' removed", "info", zone_id=zone_id)
     return {"message": "Zone deleted"}
 
 # Sensors
-@api_router.get("/sensors", response_model=List[Sensor])
-async def get_sensors():
-    sensors = await db.sensors.find({}, {"_id": 0}).to_list(100)
-    for sensor in sensors:
-        if isinstance(sensor.get('created_at'), str):
-            sensor['created_at'] = datetime.fromisoformat(sensor['created_at'])
-        if isinstance(sensor.get('last_triggered'), str):
-            sensor['last_triggered'] = datetime.fromisoformat(sensor['last_triggered'])
-    return sensors
-
-@api_router.get("/sensors/zone/{zone_id}", response_model=List[Sensor])
-async def get_sensors_by_zone(zone_id: str):
-    sensors = await db.sensors.find({"zone_id": zone_id}, {"_id": 0}).to_list(100)
-    for sensor in sensors:
-        if isinstance(sensor.get('created_at'), str):
-            sensor['created_at'] = datetime.fromisoformat(sensor['created_at'])
-        if isinstance(sensor.get('last_triggered'), str):
-            sensor['last_triggered'] = datetime.fromisoformat(sensor['last_triggered'])
-    return sensors
+@api_router.get("/sensors", response_model=None, responses={200: {"model": List[Sensor]}})
+async def get_sensors(limit: int = Query(100, ge=1, le=100), offset: int = Query(0, ge=0), fields: Optional[str] = None):
+    projection = build_projection(Sensor, fields)
+    sensors = await db.sensors.find({}, projection).sort(CREATED_SORT).skip(offset).limit(limit).to_list(limit)
+    return list_response(SENSORS_ADAPTER, Sensor, sensors)
+
+@api_router.get("/sensors/zone/{zone_id}", response_model=None, responses={200: {"model": List[Sensor]}})
+async def get_sensors_by_zone(zone_id: str, limit: int = Query(100, ge=1, le=100), offset: int = Query(0, ge=0), fields: Optional[str] = None):
+    projection = build_projection(Sensor, fields)
+    sensors = await db.sensors.find({"zone_id": zone_id}, projection).sort(CREATED_SORT).skip(offset).limit(limit).to_list(limit)
+    return list_response(SENSORS_ADAPTER, Sensor, sensors)
 
 @api_router.post("/sensors", response_model=Sensor)
 async def create_sensor(sensor_data: SensorCreate):
@@ -279,77 +456,84 @@ async def create_sensor(sensor_data: SensorCreate):
     if not zone:
         raise HTTPException(status_code=404, detail="Zone not found")
     
-    sensor = Sensor(**sensor_data.model_dump())
-    doc = sensor.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    if doc['last_triggered']:
-        doc['last_triggered'] = doc['last_triggered'].isoformat()
-    await db.sensors.insert_one(doc)
+    sensor = Sensor(**sensor_data.model_dump(), zone_name=zone['name'])
+    await db.sensors.insert_one(to_mongo(sensor))
     await log_event("sensor_added", f"Sensor '{sensor.name}' ({sensor.type}) added to zone", "info", sensor_id=sensor.id, zone_id=sensor.zone_id)
     return sensor
 
 @api_router.put("/sensors/{sensor_id}", response_model=Sensor)
 async def update_sensor(sensor_id: str, update: SensorUpdate):
-    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
+    update_data = update.model_dump(exclude_none=True)
     if not update_data:
         raise HTTPException(status_code=400, detail="No update data provided")
     
-    result = await db.sensors.update_one({"id": sensor_id}, {"$set": update_data})
-    if result.matched_count == 0:
+    if 'zone_id' in update_data:
+        zone = await db.zones.find_one({"id": update_data['zone_id']}, {"_id": 0})
+        if not zone:
+            raise HTTPException(status_code=404, detail="Zone not found")
+        update_data['zone_name'] = zone['name']
+    
+    sensor = await db.sensors.find_one_and_update(
+        {"id": sensor_id},
+        {"$set": update_data},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not sensor:
         raise HTTPException(status_code=404, detail="Sensor not found")
     
-    sensor = await db.sensors.find_one({"id": sensor_id}, {"_id": 0})
-    if isinstance(sensor.get('created_at'), str):
-        sensor['created_at'] = datetime.fromisoformat(sensor['created_at'])
-    if isinstance(sensor.get('last_triggered'), str):
-        sensor['last_triggered'] = datetime.fromisoformat(sensor['last_triggered'])
-    return Sensor(**sensor)
+    return Sensor.model_construct(**sensor)
 
 @api_router.delete("/sensors/{sensor_id}")
 async def delete_sensor(sensor_id: str):
-    sensor = await db.sensors.find_one({"id": sensor_id}, {"_id": 0})
+    sensor = await db.sensors.find_one_and_delete({"id": sensor_id}, projection={"_id": 0})
     if not sensor:
         raise HTTPException(status_code=404, detail="Sensor not found")
     
-    await db.sensors.delete_one({"id": sensor_id})
     await log_event("sensor_removed", f"Sensor '{sensor['name']}' removed", "info", sensor_id=sensor_id, zone_id=sensor.get('zone_id'))
     return {"message": "Sensor deleted"}
 
 # Sensor Trigger (Simulation)
+SENSOR_LABELS = {"motion": "Motion detected", "door": "Door opened", "window": "Window opened"}
+INTRUSION_PREFIX = "🚨 INTRUSION DETECTED: "
+SMS_ALERT_PREFIX = "🚨 SECURITY ALERT: "
+
 @api_router.post("/sensors/trigger")
 async def trigger_sensor(trigger: SensorTrigger):
-    sensor = await db.sensors.find_one({"id": trigger.sensor_id}, {"_id": 0})
-    if not sensor:
-        raise HTTPException(status_code=404, detail="Sensor not found")
-    
-    zone = await db.zones.find_one({"id": sensor['zone_id']}, {"_id": 0})
-    zone_name = zone['name'] if zone else "Unknown Zone"
-    
-    # Update sensor status
+    # Update sensor status and read it back in one round trip
     now = datetime.now(timezone.utc)
-    await db.sensors.update_one(
+    sensor = await db.sensors.find_one_and_update(
         {"id": trigger.sensor_id},
-        {"$set": {"status": "triggered", "last_triggered": now.isoformat()}}
+        {"$set": {"status": "triggered", "last_triggered": now}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
+    if not sensor:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+    
+    zone_name = sensor.get('zone_name')
+    if zone_name is None:
+        # Sensors created before zone_name was stored on them
+        zone = await db.zones.find_one({"id": sensor['zone_id']}, {"_id": 0})
+        zone_name = zone['name'] if zone else "Unknown Zone"
     
     # Get system state
     state = await get_system_state()
     
-    sensor_type_label = "Motion detected" if sensor['type'] == 'motion' else f"{sensor['type'].capitalize()} opened"
-    message = f"{sensor_type_label} - {sensor['name']} in {zone_name}"
+    message = f"{SENSOR_LABELS[sensor['type']]} - {sensor['name']} in {zone_name}"
     
     if state.mode == "armed":
         # INTRUSION ALERT!
-        await log_event("intrusion", f"🚨 INTRUSION DETECTED: {message}", "danger", sensor_id=trigger.sensor_id, zone_id=sensor['zone_id'])
-        await send_sms_alert(f"🚨 SECURITY ALERT: {message}")
+        run_in_background(log_event("intrusion", INTRUSION_PREFIX + message, "danger", sensor_id=trigger.sensor_id, zone_id=sensor['zone_id']))
+        await queue_sms_alert(SMS_ALERT_PREFIX + message)
         return {"alert": True, "message": f"INTRUSION: {message}", "severity": "danger"}
     elif state.mode == "monitoring":
         # Just log the movement
-        await log_event("sensor_triggered", f"Movement detected: {message}", "warning", sensor_id=trigger.sensor_id, zone_id=sensor['zone_id'])
+        run_in_background(log_event("sensor_triggered", f"Movement detected: {message}", "warning", sensor_id=trigger.sensor_id, zone_id=sensor['zone_id']))
         return {"alert": False, "message": f"Movement logged: {message}", "severity": "warning"}
     else:
         # System disarmed, no alert
-        await log_event("sensor_triggered", f"Sensor triggered (system disarmed): {message}", "info", sensor_id=trigger.sensor_id, zone_id=sensor['zone_id'])
+        run_in_background(log_event("sensor_triggered", f"Sensor triggered (system disarmed): {message}", "info", sensor_id=trigger.sensor_id, zone_id=sensor['zone_id']))
         return {"alert": False, "message": f"Logged: {message}", "severity": "info"}
 
 # Reset sensor status
@@ -364,70 +548,79 @@ async def reset_sensor(sensor_id: str):
     return {"message": "Sensor reset"}
 
 # Events/Activity Log
-@api_router.get("/events", response_model=List[Event])
-async def get_events(limit: int = 50):
-    events = await db.events.find({}, {"_id": 0}).sort("timestamp", -1).to_list(limit)
-    for event in events:
-        if isinstance(event.get('timestamp'), str):
-            event['timestamp'] = datetime.fromisoformat(event['timestamp'])
-    return events
+EVENTS_SORT = [("timestamp", -1), ("id", -1)]
+
+@api_router.get("/events", response_model=None, responses={200: {"model": List[Event]}})
+async def get_events(limit: int = Query(50, ge=1, le=100), before: Optional[datetime] = None, before_id: Optional[str] = None):
+    await flush_events()
+    # Page backwards with ?before=<timestamp>&before_id=<id> of the last event seen.
+    # BSON datetimes only keep milliseconds, so the id breaks ties between events
+    # written in the same millisecond. This walks the (timestamp, id) index instead
+    # of skipping over documents.
+    query = {}
+    if before and before_id:
+        query = {"$or": [
+            {"timestamp": {"$lt": before}},
+            {"timestamp": before, "id": {"$lt": before_id}}
+        ]}
+    elif before:
+        query = {"timestamp": {"$lt": before}}
+    events = await db.events.find(query, {"_id": 0}).sort(EVENTS_SORT).to_list(limit)
+    return list_response(EVENTS_ADAPTER, Event, events)
 
 @api_router.delete("/events")
 async def clear_events():
-    await db.events.delete_many({})
+    # Under the flush lock so no batch in flight can land after the delete
+    async with _event_flush_lock:
+        _event_buffer.clear()
+        await db.events.delete_many({})
     await log_event("system", "Activity log cleared", "info")
     return {"message": "Events cleared"}
 
 # Settings
-@api_router.get("/settings", response_model=Settings)
+@api_router.get("/settings", response_model=None, responses={200: {"model": Settings}})
 async def get_settings():
-    settings = await db.settings.find_one({"id": "settings"}, {"_id": 0})
-    if not settings:
-        default_settings = Settings()
-        doc = default_settings.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
-        await db.settings.insert_one(doc)
-        return default_settings
-    if isinstance(settings['updated_at'], str):
-        settings['updated_at'] = datetime.fromisoformat(settings['updated_at'])
-    return Settings(**settings)
+    settings = await get_current_settings()
+    return Response(content=settings.model_dump_json(), media_type="application/json")
 
 @api_router.put("/settings", response_model=Settings)
 async def update_settings(update: SettingsUpdate):
-    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data = update.model_dump(exclude_none=True)
+    update_data['updated_at'] = datetime.now(timezone.utc)
     
-    await db.settings.update_one(
+    settings = await db.settings.find_one_and_update(
         {"id": "settings"},
         {"$set": update_data},
-        upsert=True
+        upsert=True,
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
-    
-    settings = await db.settings.find_one({"id": "settings"}, {"_id": 0})
-    if isinstance(settings['updated_at'], str):
-        settings['updated_at'] = datetime.fromisoformat(settings['updated_at'])
-    return Settings(**settings)
+    current_settings = Settings.model_construct(**settings)
+    store_write("settings", current_settings)
+    return current_settings
 
 # Dashboard Stats
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats():
-    state = await get_system_state()
-    zones_count = await db.zones.count_documents({})
-    sensors_count = await db.sensors.count_documents({})
-    triggered_count = await db.sensors.count_documents({"status": "triggered"})
-    recent_events = await db.events.find({}, {"_id": 0}).sort("timestamp", -1).to_list(5)
-    
-    for event in recent_events:
-        if isinstance(event.get('timestamp'), str):
-            event['timestamp'] = datetime.fromisoformat(event['timestamp'])
+    await flush_events()
+    # The lookups are independent, so run them concurrently rather than one after another
+    state, zones_count, sensors_count, triggered_count, recent_events = await asyncio.gather(
+        get_system_state(),
+        db.zones.count_documents({}),
+        db.sensors.count_documents({}),
+        db.sensors.count_documents({"status": "triggered"}),
+        db.events.find({}, {"_id": 0}).sort(EVENTS_SORT).to_list(5)
+    )
     
-    return {
+    # Returned as a response object so orjson encodes the raw documents without
+    # FastAPI walking them through jsonable_encoder first
+    return ORJSONResponse({
         "system_mode": state.mode,
         "zones_count": zones_count,
         "sensors_count": sensors_count,
         "triggered_count": triggered_count,
         "recent_events": recent_events
-    }
+    })
 
 # Include the router
 app.include_router(api_router)
@@ -440,6 +633,112 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Fields that older builds stored as ISO strings rather than BSON dates
+LEGACY_DATE_FIELDS = {
+    "zones": ["created_at"],
+    "sensors": ["created_at", "last_triggered"],
+    "events": ["timestamp"],
+    "system_state": ["updated_at"],
+    "settings": ["updated_at"],
+}
+MIGRATION_BATCH_SIZE = 1000
+
+@app.on_event("startup")
+async def migrate_string_dates():
+    # Convert them once so sorting and the events cursor compare dates with dates.
+    # Once converted nothing matches, so later boots only pay for the scans.
+    for collection_name, fields in LEGACY_DATE_FIELDS.items():
+        collection = db[collection_name]
+        for field in fields:
+            updates = []
+            converted = 0
+            async for doc in collection.find({field: {"$type": "string"}}, {"_id": 1, field: 1}):
+                try:
+                    value = datetime.fromisoformat(doc[field])
+                except ValueError:
+                    logger.error(f"Cannot convert {collection_name}.{field} = {doc[field]!r} to a date")
+                    continue
+                updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {field: value}}))
+                if len(updates) >= MIGRATION_BATCH_SIZE:
+                    await collection.bulk_write(updates, ordered=False)
+                    converted += len(updates)
+                    updates = []
+            if updates:
+                await collection.bulk_write(updates, ordered=False)
+                converted += len(updates)
+            if converted:
+                logger.info(f"Converted {converted} string dates in {collection_name}.{field}")
+
+async def remove_duplicate_singletons(collection, doc_id: str):
+    # Older builds seeded these documents lazily and concurrent first reads could
+    # insert more than one; keep the most recently updated copy
+    docs = await collection.find({"id": doc_id}, {"_id": 1}).sort("updated_at", -1).to_list(None)
+    if len(docs) > 1:
+        await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs[1:]]}})
+        logger.warning(f"Removed {len(docs) - 1} duplicate '{doc_id}' documents from {collection.name}")
+
+async def ensure_index(collection, keys, **kwargs):
+    # A failed index (e.g. duplicate ids in old data) costs performance, not
+    # correctness, so log it rather than keeping the service from starting
+    try:
+        await collection.create_index(keys, **kwargs)
+    except OperationFailure as e:
+        logger.error(f"Could not create index {keys} on {collection.name}: {e}")
+
+@app.on_event("startup")
+async def create_indexes():
+    await remove_duplicate_singletons(db.system_state, "system_state")
+    await remove_duplicate_singletons(db.settings, "settings")
+    
+    # create_index is a no-op when the index already exists, so this is safe on every boot
+    await ensure_index(db.zones, "id", unique=True)
+    await ensure_index(db.zones, CREATED_SORT)
+    await ensure_index(db.sensors, "id", unique=True)
+    await ensure_index(db.sensors, CREATED_SORT)
+    await ensure_index(db.sensors, [("zone_id", 1)] + CREATED_SORT)
+    await ensure_index(db.events, EVENTS_SORT)
+    await ensure_index(db.settings, "id", unique=True)
+    await ensure_index(db.system_state, "id", unique=True)
+
+@app.on_event("startup")
+async def seed_defaults():
+    # $setOnInsert only writes when the document is missing, so concurrent or
+    # repeated boots never overwrite existing state or settings
+    await db.system_state.update_one(
+        {"id": "system_state"},
+        {"$setOnInsert": to_mongo(SystemState())},
+        upsert=True
+    )
+    await db.settings.update_one(
+        {"id": "settings"},
+        {"$setOnInsert": to_mongo(Settings())},
+        upsert=True
+    )
+
+_worker_tasks = {}
+
+@app.on_event("startup")
+async def start_workers():
+    _worker_tasks["sms"] = asyncio.create_task(sms_worker())
+    _worker_tasks["events"] = asyncio.create_task(event_flusher())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    _worker_tasks["sms"].cancel()
+    await asyncio.gather(_worker_tasks["sms"], *_background_tasks, return_exceptions=True)
+    # The flusher is stopped rather than cancelled so an in-flight batch is not lost
+    await stop_event_flusher(_worker_tasks["events"])
+    await client.close()
+
+if __name__ == "__main__":
+    import uvicorn
+    # The state cache, event buffer and SMS queue are per process, so run a single
+    # worker unless WEB_CONCURRENCY says otherwise
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=int(os.environ.get('PORT', 8000)),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get('WEB_CONCURRENCY', 1))
+    )
@@ -1,8 +1,13 @@
 import requests
+from requests.adapters import HTTPAdapter
 import sys
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+MAX_WORKERS = 8
+
 class AlarmSystemAPITester:
     def __init__(self, base_url="https://safe-house.preview.emergentagent.com/api"):
         self.base_url = base_url
@@ -10,50 +15,96 @@ class AlarmSystemAPITester:
         self.tests_passed = 0
         self.created_zones = []
         self.created_sensors = []
+        self.lock = threading.Lock()
+        # Per-thread Session and output buffer; requests does not promise a
+        # Session is safe to share between threads
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        """This thread's Session, reusing connections instead of a new TCP + TLS handshake per request"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({'Content-Type': 'application/json'})
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self.local.session = session
+        return session
+
+    def log(self, message=""):
+        """Print now, or buffer the line while running under run_isolated"""
+        output = getattr(self.local, 'output', None)
+        if output is None:
+            print(message)
+        else:
+            output.append(message)
+
+    def run_isolated(self, test, *args):
+        """Run a test on a worker thread and print its output as one block when it finishes"""
+        self.local.output = []
+        try:
+            return test(*args)
+        finally:
+            output, self.local.output = self.local.output, None
+            with self.lock:
+                print("\n".join(output))
 
     def run_test(self, name, method, endpoint, expected_status, data=None, params=None):
         """Run a single API test"""
         url = f"{self.base_url}/{endpoint}"
-        headers = {'Content-Type': 'application/json'}
 
-        self.tests_run += 1
-        print(f"\n🔍 Testing {name}...")
+        with self.lock:
+            self.tests_run += 1
+        self.log(f"\n🔍 Testing {name}...")
         
         try:
             if method == 'GET':
-                response = requests.get(url, headers=headers, params=params)
+                response = self.session.get(url, params=params)
             elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers)
+                response = self.session.post(url, json=data)
             elif method == 'PUT':
-                response = requests.put(url, json=data, headers=headers)
+                response = self.session.put(url, json=data)
             elif method == 'DELETE':
-                response = requests.delete(url, headers=headers)
+                response = self.session.delete(url)
 
             success = response.status_code == expected_status
             if success:
-                self.tests_passed += 1
-                print(f"✅ Passed - Status: {response.status_code}")
+                with self.lock:
+                    self.tests_passed += 1
+                self.log(f"✅ Passed - Status: {response.status_code}")
                 try:
                     return True, response.json() if response.text else {}
                 except:
                     return True, {}
             else:
-                print(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
+                self.log(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
                 if response.text:
-                    print(f"   Response: {response.text[:200]}")
+                    self.log(f"   Response: {response.text[:200]}")
                 return False, {}
 
         except Exception as e:
-            print(f"❌ Failed - Error: {str(e)}")
+            self.log(f"❌ Failed - Error: {str(e)}")
             return False, {}
 
+    def check(self, name, condition):
+        """Record a check on response content as a test"""
+        with self.lock:
+            self.tests_run += 1
+            if condition:
+                self.tests_passed += 1
+        self.log(f"\n🔍 Checking {name}...")
+        self.log("✅ Passed" if condition else "❌ Failed")
+        return condition
+
     def test_root_endpoint(self):
         """Test root API endpoint"""
         return self.run_test("Root API", "GET", "", 200)
 
     def test_system_state(self):
         """Test system state endpoints"""
-        print("\n=== Testing System State ===")
+        self.log("\n=== Testing System State ===")
         
         # Get initial state
         success, state = self.run_test("Get System State", "GET", "system/state", 200)
@@ -70,7 +121,7 @@ class AlarmSystemAPITester:
 
     def test_zones_crud(self):
         """Test zones CRUD operations"""
-        print("\n=== Testing Zones CRUD ===")
+        self.log("\n=== Testing Zones CRUD ===")
         
         # Get initial zones
         success, zones = self.run_test("Get Zones", "GET", "zones", 200)
@@ -106,10 +157,10 @@ class AlarmSystemAPITester:
 
     def test_sensors_crud(self):
         """Test sensors CRUD operations"""
-        print("\n=== Testing Sensors CRUD ===")
+        self.log("\n=== Testing Sensors CRUD ===")
         
         if not self.created_zones:
-            print("❌ No zones available for sensor testing")
+            self.log("❌ No zones available for sensor testing")
             return False
         
         zone_id = self.created_zones[0]
@@ -153,10 +204,10 @@ class AlarmSystemAPITester:
 
     def test_sensor_triggering(self):
         """Test sensor triggering simulation"""
-        print("\n=== Testing Sensor Triggering ===")
+        self.log("\n=== Testing Sensor Triggering ===")
         
         if not self.created_sensors:
-            print("❌ No sensors available for triggering test")
+            self.log("❌ No sensors available for triggering test")
             return False
         
         sensor_id = self.created_sensors[0]
@@ -172,7 +223,7 @@ class AlarmSystemAPITester:
             # Trigger sensor
             success, response = self.run_test(f"Trigger Sensor ({state})", "POST", "sensors/trigger", 200, {"sensor_id": sensor_id})
             if success:
-                print(f"   Alert: {response.get('alert', False)}, Message: {response.get('message', 'N/A')}")
+                self.log(f"   Alert: {response.get('alert', False)}, Message: {response.get('message', 'N/A')}")
         
         # Reset sensor
         success, _ = self.run_test("Reset Sensor", "POST", f"sensors/{sensor_id}/reset", 200)
@@ -180,22 +231,96 @@ class AlarmSystemAPITester:
 
     def test_events_activity_log(self):
         """Test events/activity log endpoints"""
-        print("\n=== Testing Activity Log ===")
+        self.log("\n=== Testing Activity Log ===")
         
         # Get events
         success, events = self.run_test("Get Events", "GET", "events", 200)
         if not success:
             return False
         
-        print(f"   Found {len(events)} events")
+        self.log(f"   Found {len(events)} events")
         
         # Get events with limit
         success, _ = self.run_test("Get Events with Limit", "GET", "events", 200, params={"limit": 10})
         return success
 
+    def test_list_pagination(self):
+        """Test limit/offset/fields on the zone and sensor lists"""
+        self.log("\n=== Testing List Pagination ===")
+        
+        # Make sure there are at least two zones to page over
+        for i in range(2):
+            success, zone = self.run_test(f"Create Paging Zone {i + 1}", "POST", "zones", 200, {"name": f"Test Paging Zone {i + 1}"})
+            if not success:
+                return False
+            self.created_zones.append(zone.get('id'))
+        
+        success, first_page = self.run_test("Get Zones Page 1", "GET", "zones", 200, params={"limit": 1, "offset": 0})
+        if not success:
+            return False
+        success, second_page = self.run_test("Get Zones Page 2", "GET", "zones", 200, params={"limit": 1, "offset": 1})
+        if not success:
+            return False
+        
+        first_ids = {zone.get('id') for zone in first_page}
+        second_ids = {zone.get('id') for zone in second_page}
+        if not self.check("Zone pages hold one zone each", len(first_page) == 1 and len(second_page) == 1):
+            return False
+        if not self.check("Zone pages do not overlap", not first_ids & second_ids):
+            return False
+        
+        # Field selection keeps id and required fields, drops the rest
+        success, zones = self.run_test("Get Zones with fields=name", "GET", "zones", 200, params={"fields": "name"})
+        if not success:
+            return False
+        if not self.check("fields=name omits description", zones and all('description' not in zone and 'id' in zone and 'name' in zone for zone in zones)):
+            return False
+        
+        success, _ = self.run_test("Get Sensors with fields=name", "GET", "sensors", 200, params={"fields": "name"})
+        if not success:
+            return False
+        
+        # Invalid parameters are rejected instead of failing server-side
+        checks = [
+            ("Get Zones with Unknown Field", "zones", {"fields": "bogus"}, 400),
+            ("Get Sensors with Unknown Field", "sensors", {"fields": "bogus"}, 400),
+            ("Get Zones with limit=0", "zones", {"limit": 0}, 422),
+            ("Get Zones with Negative Offset", "zones", {"offset": -1}, 422),
+            ("Get Sensors with limit=1000", "sensors", {"limit": 1000}, 422),
+        ]
+        for name, endpoint, params, status in checks:
+            success, _ = self.run_test(name, "GET", endpoint, status, params=params)
+            if not success:
+                return False
+        
+        return True
+
+    def test_events_pagination(self):
+        """Test the before/before_id cursor on the activity log"""
+        self.log("\n=== Testing Activity Log Pagination ===")
+        
+        success, first_page = self.run_test("Get Events Page 1", "GET", "events", 200, params={"limit": 2})
+        if not success:
+            return False
+        if not self.check("Events page 1 is not empty", len(first_page) > 0):
+            return False
+        
+        last = first_page[-1]
+        success, second_page = self.run_test("Get Events Page 2", "GET", "events", 200, params={"limit": 2, "before": last.get('timestamp'), "before_id": last.get('id')})
+        if not success:
+            return False
+        
+        first_ids = {event.get('id') for event in first_page}
+        second_ids = {event.get('id') for event in second_page}
+        if not self.check("Event pages do not overlap", not first_ids & second_ids):
+            return False
+        
+        success, _ = self.run_test("Get Events with limit=0", "GET", "events", 422, params={"limit": 0})
+        return success
+
     def test_settings(self):
         """Test settings endpoints"""
-        print("\n=== Testing Settings ===")
+        self.log("\n=== Testing Settings ===")
         
         # Get settings
         success, settings = self.run_test("Get Settings", "GET", "settings", 200)
@@ -217,28 +342,27 @@ class AlarmSystemAPITester:
 
     def test_dashboard_stats(self):
         """Test dashboard stats endpoint"""
-        print("\n=== Testing Dashboard Stats ===")
+        self.log("\n=== Testing Dashboard Stats ===")
         
         success, stats = self.run_test("Get Dashboard Stats", "GET", "dashboard/stats", 200)
         if success:
-            print(f"   System Mode: {stats.get('system_mode')}")
-            print(f"   Zones: {stats.get('zones_count')}")
-            print(f"   Sensors: {stats.get('sensors_count')}")
-            print(f"   Triggered: {stats.get('triggered_count')}")
+            self.log(f"   System Mode: {stats.get('system_mode')}")
+            self.log(f"   Zones: {stats.get('zones_count')}")
+            self.log(f"   Sensors: {stats.get('sensors_count')}")
+            self.log(f"   Triggered: {stats.get('triggered_count')}")
         
         return success
 
     def cleanup(self):
         """Clean up created test data"""
-        print("\n=== Cleanup ===")
+        self.log("\n=== Cleanup ===")
         
-        # Delete created sensors
-        for sensor_id in self.created_sensors:
-            self.run_test(f"Delete Sensor {sensor_id}", "DELETE", f"sensors/{sensor_id}", 200)
-        
-        # Delete created zones
-        for zone_id in self.created_zones:
-            self.run_test(f"Delete Zone {zone_id}", "DELETE", f"zones/{zone_id}", 200)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            # Delete created sensors
+            list(executor.map(lambda sensor_id: self.run_isolated(self.run_test, f"Delete Sensor {sensor_id}", "DELETE", f"sensors/{sensor_id}", 200), self.created_sensors))
+            
+            # Delete created zones
+            list(executor.map(lambda zone_id: self.run_isolated(self.run_test, f"Delete Zone {zone_id}", "DELETE", f"zones/{zone_id}", 200), self.created_zones))
 
 def main():
     print("🏠 Home Intruder Alarm System - Backend API Testing")
@@ -247,21 +371,22 @@ def main():
     tester = AlarmSystemAPITester()
     
     try:
-        # Run all tests
-        tests = [
-            tester.test_root_endpoint,
-            tester.test_system_state,
-            tester.test_zones_crud,
-            tester.test_sensors_crud,
-            tester.test_sensor_triggering,
-            tester.test_events_activity_log,
-            tester.test_settings,
-            tester.test_dashboard_stats
+        # Run all tests. Tests within a phase are independent and run in parallel;
+        # phases run in order (zones before sensors before triggering, and the
+        # triggering test owns the system mode while it runs).
+        phases = [
+            [tester.test_root_endpoint, tester.test_system_state, tester.test_zones_crud, tester.test_settings],
+            [tester.test_sensors_crud, tester.test_list_pagination],
+            [tester.test_sensor_triggering],
+            [tester.test_events_activity_log, tester.test_events_pagination, tester.test_dashboard_stats]
         ]
         
-        for test in tests:
-            if not test():
-                print(f"\n❌ Test {test.__name__} failed, continuing with other tests...")
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for phase in phases:
+                results = list(executor.map(tester.run_isolated, phase))
+                for test, result in zip(phase, results):
+                    if not result:
+                        print(f"\n❌ Test {test.__name__} failed, continuing with other tests...")
         
         # Cleanup
         tester.cleanup()